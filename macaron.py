@@ -29,12 +29,16 @@ __version__ = "0.4.0-dev"
 __license__ = "MIT License"
 
 import sqlite3, re, sys
-import copy, warnings
+import warnings
 import logging
-import collections
-from datetime import datetime
+import collections, itertools, operator
+import traceback
+from datetime import datetime, date, time
+try: import bottle as _bottle   # for MacaronPlugin
+except ImportError: _bottle = None
 
 PY3K = sys.version_info.major >= 3
+_TEXT_TYPES = (str, bytes) if PY3K else (basestring,)
 
 # --- Exceptions
 class ObjectDoesNotExist(Exception): pass
@@ -50,12 +54,15 @@ class NotNull(object): pass
 
 # for LIKE query
 class Like(object):
+    __slots__ = ("likestr",)
     def __init__(self, s):
         self.likestr = s
 
 # --- Module global attributes
 _m = None               # Macaron object
-_pre_field_order = []   # Created order of Model field object
+_default_conn = None    # Cache of _m.connection["default"] for module methods
+_field_counter = itertools.count()  # Created order of Model field object
+_by_creation_order = operator.attrgetter("_creation_order")  # Sort key of fields in declared order
 history = None          #: Returns history of SQL execution. You can get history like a list (index:0 is latest).
 SQL_TRACE_OUT = None    # In case of tracing SQL and parameters on CursorWrapper, set output stream(ex. sys.stderr)
 sqlite_version_info = sqlite3.sqlite_version_info
@@ -63,7 +70,8 @@ sqlite_version_info = sqlite3.sqlite_version_info
 #_callbacks_when_connect = [] # TEMPORARY BUG FIX: see the comment of ModelMeta.__init__()
 
 # --- Module methods
-def macaronage(dbfile=":memory:", lazy=False, autocommit=False, logger=None, history=-1, keep=False, threading=False, regexp=None):
+def macaronage(dbfile=":memory:", lazy=False, autocommit=False, logger=None, history=-1, keep=False, threading=False, regexp=None,
+               detect_types=0, cached_statements=1024):
     """
     :param dbfile: SQLite database file name.
     :param lazy: Uses :class:`LazyConnection`.
@@ -72,6 +80,9 @@ def macaronage(dbfile=":memory:", lazy=False, autocommit=False, logger=None, his
     :param history: Sets max count of SQL execution history (0 is unlimited, -1 is disabled).
                     Default: disabled
     :param keep: keep previous object and connection (EXPERIMENTAL)
+    :param detect_types: Passed to :func:`sqlite3.connect` (default: 0). Date and time columns
+                         are converted by their fields, so this is not needed for models.
+    :param cached_statements: Size of the prepared statement cache of :func:`sqlite3.connect`.
     :type logger: :class:`logging.Logger`
 
     Initializes macaron.
@@ -96,8 +107,10 @@ def macaronage(dbfile=":memory:", lazy=False, autocommit=False, logger=None, his
     #   id -1221678384' in <bound method Macaron.__del__ of <macaron.Macaron object at 0xb4a93eec>> ignored
     # But this is NOT a fundamental solution...Maybe.
     # About threadsafety of sqlite3: http://www.sqlite.org/threadsafe.html
-    if lazy: conn = LazyConnection(dbfile, factory=_create_wrapper(logger), check_same_thread=(not threading))
-    else: conn = sqlite3.connect(dbfile, factory=_create_wrapper(logger), check_same_thread=(not threading))
+    kw = {"factory": _create_wrapper(logger), "check_same_thread": (not threading),
+          "detect_types": detect_types, "cached_statements": cached_statements}
+    if lazy: conn = LazyConnection(dbfile, **kw)
+    else: conn = sqlite3.connect(dbfile, **kw)
     if not conn: raise Exception("Can't create connection.")
 
     # Set REGEXP function
@@ -113,6 +126,7 @@ def macaronage(dbfile=":memory:", lazy=False, autocommit=False, logger=None, his
 
     _m.connection["default"] = conn
     _m.autocommit = autocommit
+    globals()["_default_conn"] = conn
 
     # TEMPORARY BUG FIX: see the comment of ModelMeta.__init__()
     # For fetching column info only.
@@ -122,14 +136,15 @@ def macaronage(dbfile=":memory:", lazy=False, autocommit=False, logger=None, his
 
 def execute(*args, **kw):
     """Wrapper for ``Cursor#execute()``."""
-    return _m.connection["default"].cursor().execute(*args, **kw)
+    return _default_conn.cursor().execute(*args, **kw)
 
-def bake():     _m.connection["default"].commit()   # Commits
-def rollback(): _m.connection["default"].rollback() # Rollback
+def bake():     _default_conn.commit()      # Commits
+def rollback(): _default_conn.rollback()    # Rollback
 def cleanup():
     """Closes database and tidies up the Macaron object"""
-    _m.connection["default"].close()
+    _default_conn.close()
     globals()["_m"] = None
+    globals()["_default_conn"] = None
 
 def create_table(cls, cascade=False, link_tables=True):
     """Create table from Model class"""
@@ -143,10 +158,10 @@ def create_table(cls, cascade=False, link_tables=True):
 
     # Process Field and ManyToOne objects, which are defined by user
     cdic = cls.__dict__ # for direct access to property objects
-    field_order = {}
+    fields = []
     has_primary_key = False
-    for k, fld in filter(lambda x: isinstance(x[1], Field), cdic.items()):
-        if not fld.is_user_defined: continue
+    for k, fld in cdic.items():
+        if not isinstance(fld, Field) or not fld.is_user_defined: continue
         if isinstance(fld, ManyToOne):
             meta = None
             # The reference table exists or not.
@@ -166,7 +181,7 @@ def create_table(cls, cascade=False, link_tables=True):
         else:
             fld.name = k
             if fld.is_primary_key: has_primary_key = True
-        field_order[_pre_field_order.index(fld)] = fld
+        fields.append(fld)
 
     # Create primary key field if not exists
     field_clauses = []
@@ -176,12 +191,12 @@ def create_table(cls, cascade=False, link_tables=True):
         field_clauses.append(fld.field_clause())
 
     # Generate CREATE TABLE clause and execute
-    for k in sorted(field_order.keys()): field_clauses.append(field_order[k].field_clause())
+    for fld in sorted(fields, key=_by_creation_order): field_clauses.append(fld.field_clause())
     sql  = 'CREATE TABLE "%s" (\n  %s' % (cdic["_meta"].table_name, ",\n  ".join(field_clauses))
     if cdic["_meta"].unique_together: sql += ',\n  UNIQUE ("%s")' % '", "'.join(cdic["_meta"].unique_together)
     sql += "\n)"
     execute(sql)
-    _m.connection["default"].cache_table_info(cdic["_meta"].table_name, warn=False)
+    _default_conn.cache_table_info(cdic["_meta"].table_name, warn=False)
 
     if link_tables:
         create_link_tables(cls)
@@ -189,9 +204,9 @@ def create_table(cls, cascade=False, link_tables=True):
 def create_link_tables(cls):
     cdic = cls.__dict__ # for direct access to property objects
     # Avoid for RuntimeError: dictionary changed size during iteration,
-    # convert cdic.items() to list
-    for k, fld in filter(lambda x: isinstance(x[1], ManyToMany), list(cdic.items())):
-        create_table(fld.lnk)
+    # convert cdic.values() to list
+    for fld in list(cdic.values()):
+        if isinstance(fld, ManyToMany): create_table(fld.lnk)
 
 # --- Classes
 class Macaron(object):
@@ -222,19 +237,30 @@ class Macaron(object):
         return self.connection[meta_obj.conn_name]
 
 # --- Connection wrappers
+_SQL_ALL_TABLE_INFO = """SELECT m.name, p.cid, p.name, p.type, p."notnull", p.dflt_value, p.pk
+FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+WHERE m.type = 'table' ORDER BY m.name, p.cid"""
+
 def _create_wrapper(logger):
     """Returns ConnectionWrapper class"""
     class ConnectionWrapper(sqlite3.Connection):
         def __init__(self, *args, **kw):
             super(ConnectionWrapper, self).__init__(*args, **kw)
-            self.execute("PRAGMA foreign_keys = ON")    # fkey support ON (SQLite>=3.6.19)
+            # Connection setup without result rows is run as a script (not cached as statement)
+            self.executescript("PRAGMA foreign_keys = ON;")     # fkey support ON (SQLite>=3.6.19)
             self.warn_pragma = True
 
             # Cache results of PRAGMA table_info() for TRANSACTION
             self.table_info = {}
-            cur = self.execute("SELECT * FROM sqlite_master WHERE type = 'table'")
-            for rec in cur:
-                self.cache_table_info(rec[2], warn=False)
+            if sqlite_version_info >= (3, 16, 0):
+                # Fetch columns of all tables at once with table-valued pragma function
+                cur = self.execute(_SQL_ALL_TABLE_INFO)
+                for name, rows in itertools.groupby(cur, lambda row: row[0]):
+                    self.table_info[name] = tuple(row[1:] for row in rows)
+            else:
+                cur = self.execute("SELECT * FROM sqlite_master WHERE type = 'table'")
+                for rec in cur.fetchall():
+                    self.cache_table_info(rec[2], warn=False)
 
         def cursor(self):
             self.logger = logger
@@ -246,11 +272,12 @@ def _create_wrapper(logger):
 #            else:
 #                print 'PRAGMA table_info("%s")' % table_name
             cur = self.execute('PRAGMA table_info("%s")' % table_name)
-            self.table_info[table_name] = cur.fetchall()
-            return self.table_info[table_name][:]
+            self.table_info[table_name] = tuple(cur.fetchall())
+            return self.table_info[table_name]
 
         def get_table_info(self, table_name):
-            if table_name in self.table_info: return self.table_info[table_name][:]
+            # Cached table info is a tuple, so it is returned without copying.
+            if table_name in self.table_info: return self.table_info[table_name]
             return self.cache_table_info(table_name)
 
     return ConnectionWrapper
@@ -258,33 +285,67 @@ def _create_wrapper(logger):
 class CursorWrapper(sqlite3.Cursor):
     """Subclass of sqlite3.Cursor for logging"""
     def execute(self, sql, parameters=[]):
-        if self.connection.logger:
-            self.connection.logger.debug("%s\nparams: %s" % (sql, str(parameters)))
-        if(isinstance(history, ListHandler)):
-            history.lastsql = sql
-            history.lastparams = parameters
-        if SQL_TRACE_OUT:
-            SQL_TRACE_OUT.write("[macaron:SQL  ]:%s\n" % sql)
-            SQL_TRACE_OUT.write("[macaron:PARAM]:%s\n" % str(parameters))
+        self._trace(sql, parameters)
         try:
             return super(CursorWrapper, self).execute(sql, parameters)
-        except:
-            sys.stderr.write("[macaron:Error in SQL  ]\n%s\n" % sql)
-            sys.stderr.write("[macaron:Error in PARAM]\n%s\n" % str(parameters))
+        except sqlite3.Error:
+            self._trace_error(sql, parameters)
+            raise
+
+    def executemany(self, sql, seq_of_parameters):
+        # Iterators are materialized only when the parameters are traced
+        if self._tracing() and not isinstance(seq_of_parameters, (list, tuple)):
+            seq_of_parameters = list(seq_of_parameters)
+        self._trace(sql, seq_of_parameters, many=True)
+        try:
+            return super(CursorWrapper, self).executemany(sql, seq_of_parameters)
+        except sqlite3.Error:
+            self._trace_error(sql, seq_of_parameters)
             raise
 
+    def _tracing(self):
+        h = history
+        return self.connection.logger is not None or SQL_TRACE_OUT is not None \
+            or (h is not None and h.max_count >= 0)
+
+    def _trace(self, sql, parameters, many=False):
+        logger = self.connection.logger
+        if logger is not None:
+            logger.debug("%s\nparams: %s", sql, parameters,
+                         extra={"macaron_sql": sql, "macaron_params": parameters})
+        h = history
+        if h is not None:
+            h.lastsql = sql
+            h.lastparams = None if many else parameters     # not to keep a large list alive
+        out = SQL_TRACE_OUT
+        if out is not None:
+            out.write("[macaron:SQL  ]:%s\n" % sql)
+            out.write("[macaron:PARAM]:%s\n" % (parameters,))
+
+    def _trace_error(self, sql, parameters):
+        sys.stderr.write("[macaron:Error in SQL  ]\n%s\n" % sql)
+        sys.stderr.write("[macaron:Error in PARAM]\n%s\n" % (parameters,))
+
 class LazyConnection(object):
     """Lazy connection wrapper"""
+    # Methods bound to the instance after connecting, for bypassing __getattr__()
+    _DELEGATED = ("cursor", "execute", "commit", "rollback", "close", "create_function")
+
     def __init__(self, *args, **kw):
         self.args = args
         self.kwargs = kw
         self._conn = None
 
     def __getattr__(self, name):
-        if not self._conn and (name in ["commit", "rollback", "close"]): return self.noop
-        self._conn = self._conn or sqlite3.connect(*self.args, **self.kwargs)
+        if self._conn is None:
+            if name in ("commit", "rollback", "close"): return self.noop
+            self._connect()
         return getattr(self._conn, name)
 
+    def _connect(self):
+        self._conn = sqlite3.connect(*self.args, **self.kwargs)
+        for name in self._DELEGATED: setattr(self, name, getattr(self._conn, name))
+
     def noop(self): return  # NO-OP for commit, rollback, close
 
 # --- Logging
@@ -294,11 +355,9 @@ class ListHandler(logging.Handler):
        :param max_count: max count of SQL history (0 is unlimited, -1 is disabled)
     """
     class _SQLParamTracer(object):
-        def __init__(self, msg):
-            m = re.match(r"(?P<sql>.+)\nparams: (?P<params>.+)", msg, re.MULTILINE + re.DOTALL)
-            if not m: raise RuntimeError("Invalid message format. '%s'" % msg)
-            self.sql = m.group("sql")
-            self.param_str = m.group("params")
+        def __init__(self, sql, params):
+            self.sql = sql
+            self.param_str = str(params)
         def __str__(self): return "%s\nparams: %s" % (self.sql, self.param_str)
         def __unicode__(self): return u"%s\nparams: %s" % (self.sql, self.param_str)
 
@@ -307,20 +366,20 @@ class ListHandler(logging.Handler):
         self.lastsql = None
         self.lastparams = None
         self._max_count = max_count
-        self._list = []
+        self._list = collections.deque(maxlen=(max_count if max_count > 0 else None))
 
     def emit(self, record):
         if self._max_count < 0: return
-        if self._max_count > 0:
-            while len(self._list) >= self._max_count: self._list.pop()
-        self._list.insert(0, self._SQLParamTracer(record.getMessage()))
+        # SQL and parameters are passed by CursorWrapper#execute() as extra attributes
+        sql = getattr(record, "macaron_sql", None)
+        if sql is None: return
+        self._list.appendleft(self._SQLParamTracer(sql, record.macaron_params))
 
     def _get_max_count(self): return self._max_count
 
     def set_max_count(self, max_count):
         self._max_count = max_count
-        if max_count > 0:
-            while len(self._list) > self._max_count: self._list.pop()
+        self._list = collections.deque(self._list, maxlen=(max_count if max_count > 0 else None))
     max_count = property(_get_max_count)
 
     def count(self): return len(self._list)
@@ -331,50 +390,71 @@ class ListHandler(logging.Handler):
         return self._list.__getitem__(idx)
 
 # --- Table and field information
-class FieldInfoCollection(list):
-    """FieldInfo collection"""
-    def __init__(self): self._field_dict = {}
+class FieldInfoCollection(object):
+    """FieldInfo collection, accessible by field name or by index"""
+    def __init__(self):
+        self._field_dict = {}
+        self._fields = ()   # ordered view for iteration and index access
 
     def append(self, fld):
-        super(FieldInfoCollection, self).append(fld)
         self._field_dict[fld.name] = fld
+        self._fields += (fld,)
 
     def __getitem__(self, name):
-        if isinstance(name, int):
-            return super(FieldInfoCollection, self).__getitem__(name)
-        return self._field_dict[name]
+        if type(name) is str: return self._field_dict[name]
+        return self._fields[name]
 
     def keys(self): return self._field_dict.keys()
-
-    def __in__(self, name): return name in self._field_dict
+    def __iter__(self): return iter(self._fields)
+    def __len__(self): return len(self._fields)
+    def __contains__(self, name): return name in self._field_dict
 
 class ClassProperty(property):
     """Using class property wrapper class"""
     def __get__(self, owner_obj, cls): return self.fget.__get__(owner_obj, cls)()
 
 class FieldFactory(object):
+    """Creates Field objects from the column information of 'PRAGMA table_info()'.
+
+    TableMetaInfo builds the fields from the Model declarations and doesn't use this
+    (see the commented out code in TableMetaInfo.__init__()). It is kept for callers
+    which map existing tables.
+    """
+    _type_cache = {}    # Declared type (upper case) -> Field class
+
+    @staticmethod
+    def field_class(type_str):
+        """Returns Field class for the declared column type."""
+        cache = FieldFactory._type_cache
+        use_field_class = cache.get(type_str)
+        if use_field_class is None:
+            # Declared types are case insensitive, so look up by the upper cased one.
+            key = type_str.upper()
+            use_field_class = cache.get(key)
+            if use_field_class is None:
+                use_field_class = Field
+                for fldcls in TYPE_FIELDS:
+                    if any(r.search(key) for r in fldcls._TYPE_RES):
+                        use_field_class = fldcls
+                        break
+                cache[key] = use_field_class
+            cache[type_str] = use_field_class
+        return use_field_class
+
     @staticmethod
     def create(row, cls):
-        rec = dict(zip(["cid", "name", "type", "not_null", "default", "is_primary_key"], row))
-        cdict = cls.__dict__
-        if rec["name"] in cdict and not isinstance(cdict[rec["name"]], Field):
+        cid, name, type_str, not_null, default, is_primary_key = row
+        fld = cls.__dict__.get(name)
+        if fld is not None and not isinstance(fld, Field):
             raise TypeError("Fields must be Field objects.")
-        if rec["name"] in cdict and cdict[rec["name"]].is_user_defined:
-            fld = cls.__dict__[rec["name"]]
-        else:
-            fldkw = {"null": not rec["not_null"], "primary_key": rec["is_primary_key"]}
-            use_field_class = Field
-            for fldcls in TYPE_FIELDS:
-                if filter(lambda s:re.search(s, row[2]), fldcls.TYPE_NAMES):
-                    use_field_class = fldcls
-                    break
-            fld = use_field_class(**fldkw)
-        fld.cid, fld.name, fld.type = row[0:3]
+        if fld is None or not fld.is_user_defined:
+            fld = FieldFactory.field_class(type_str)(null=not not_null, primary_key=is_primary_key)
+        fld.cid, fld.name, fld.type = cid, name, type_str
         fld.initialize_after_meta()
         # convert default from 'PRAGMA table_info()'.
-        if fld.default == None and rec["default"] != None:
-            fld.default = fld.cast(rec["default"])
-        setattr(cls, rec["name"], fld)
+        if fld.default == None and default != None:
+            fld.default = fld.cast(default)
+        setattr(cls, name, fld)
         return fld
 
 class TableMetaClassProperty(property):
@@ -386,9 +466,12 @@ class TableMetaClassProperty(property):
         self.conn_name = "default"  #: for future use. multiple databases?
 
     def __get__(self, owner_obj, cls):
-        if not self.table_meta:
-            self.table_meta = TableMetaInfo(_m.get_connection(self), self.table_name, cls)
-        return self.table_meta
+        # The descriptor is kept in the class (not replaced with TableMetaInfo),
+        # because Macaron#__del__() resets table_meta for the next connection.
+        table_meta = self.table_meta
+        if table_meta is None:
+            table_meta = self.table_meta = TableMetaInfo(_m.get_connection(self), self.table_name, cls)
+        return table_meta
 
 class TableMetaInfo(object):
     """Table information class.
@@ -402,26 +485,30 @@ class TableMetaInfo(object):
         self.fields = FieldInfoCollection() #: Table fields collection
         self.primary_key = None             #: Primary key :class:`Field`
         self.table_name = table_name        #: Table name
+        self._cls = cls
+        self._factories = {}                # Column names -> generated factory function
+        self._last_factory = (None, None)   # (cursor.description, factory) used last
+        self._fields_by_class = {}          # Field class -> fields which are its instances
 
         # To avoid duplicated definition of class field.
         # Initial fields are specified in _meta.initial_field
-        field_order = {}
+        initial_field = cls.__dict__["_meta"].initial_field
 #        for name, fld in cls.__dict__.items():
 #            if not isinstance(fld, Field): continue
-        for name, fld in cls.__dict__["_meta"].initial_field.items():
-            field_order[_pre_field_order.index(fld)] = fld
+        for name, fld in initial_field.items():
             fld.name = name
 
         # --- TEMPORARY BUG FIX ---
-        for idx in sorted(field_order.keys()):
-            fld = field_order[idx]
+        for fld in sorted(initial_field.values(), key=_by_creation_order):
             if isinstance(fld, ManyToOne):
                 # In case of ManyToOne field, the actual field of the one is set into the class.
                 # ex. author ManyToOne field corresponds to author_id IntegerField.
                 if fld.fkey not in cls.__dict__:
                     reffld = None
-                    for f in filter(lambda v:isinstance(v, Field), fld.ref.__dict__.values()):
-                        if f.is_primary_key: reffld = f
+                    for f in vars(fld.ref).values():
+                        if isinstance(f, Field) and f.is_primary_key:
+                            reffld = f
+                            break
                     if isinstance(reffld, IntegerField): fkey = IntegerField(null=fld.null)
                     assert fkey, "Foreign key must be Integer"
                     setattr(cls, fld.fkey, fkey)
@@ -436,6 +523,71 @@ class TableMetaInfo(object):
                 self.fields.append(fld)
             if fld.is_primary_key: self.primary_key = fld
 
+        # Precomputed names and SQL for Model and QuerySet
+        self._table_quoted = '"%s"' % self.table_name
+        self._pk_quoted = '"%s"' % self.primary_key.name
+        self._field_names = tuple(fld.name for fld in self.fields)
+        # Stored values must be re-read only when they differ from the object's values.
+        # Values of fields which don't cast them (ex. Field) may be converted by the column affinity.
+        self._refetch_after_store = any(type(fld).to_database != Field.to_database \
+            or type(fld).to_object != Field.to_object or fld.extra_sql \
+            or (type(fld).cast == Field.cast and not isinstance(fld, CharField)) for fld in self.fields)
+        # TEXT affinity converts numbers to text, so CharField values are checked when storing
+        self._char_field_names = tuple(fld.name for fld in self.fields
+                                       if isinstance(fld, CharField) and type(fld).cast == Field.cast)
+        self._default_data = dict((fld.name, fld.default) for fld in self.fields)  # copied in Model.__init__()
+        # Keyword names accepted by Model.__init__() (columns and ManyToOne fields)
+        self._valid_kwargs = frozenset(self._field_names) \
+            | frozenset(k for k, v in vars(cls).items() if isinstance(v, Field))
+        self._insert_names = tuple(n for n in self._field_names if n != self.primary_key.name)
+        self._insert_sql = self._make_insert_sql(self._field_names)
+        self._insert_sql_no_pk = self._make_insert_sql(self._insert_names)
+        holder = ", ".join(['"%s" = ?' % n for n in self._field_names])
+        self._update_sql = "UPDATE %s SET %s WHERE %s = ?" % (self._table_quoted, holder, self._pk_quoted)
+        self._delete_sql = "DELETE FROM %s WHERE %s = ?" % (self._table_quoted, self._pk_quoted)
+
+    def _make_insert_sql(self, names):
+        holder = ", ".join(["?"] * len(names))
+        return 'INSERT INTO %s ("%s") VALUES (%s)' % (self._table_quoted, '", "'.join(names), holder)
+
+    def fields_of(self, fldcls):
+        """Returns a tuple of the fields which are instances of *fldcls* (ex. AtCreate)."""
+        flds = self._fields_by_class.get(fldcls)
+        if flds is None:
+            flds = self._fields_by_class[fldcls] = tuple(fld for fld in self.fields if isinstance(fld, fldcls))
+        return flds
+
+    def get_factory(self, description):
+        """Returns the function converting a row to the model object.
+        The function is generated for the columns of *description* and cached.
+        """
+        # cursor.description is the same object for all rows of a query
+        last_desc, func = self._last_factory
+        if description is last_desc: return func
+        names = tuple(d[0] for d in description)
+        func = self._factories.get(names)
+        if func is None:
+            func = self._factories[names] = self._generate_factory(names)
+        self._last_factory = (description, func)
+        return func
+
+    def _generate_factory(self, names):
+        idx = dict((name, i) for i, name in enumerate(names))
+        ns = {"cls": self._cls, "Row": sqlite3.Row}
+        args, use_row = [], False
+        for i, fld in enumerate(self.fields):
+            value = "row[%d]" % idx[fld.name]
+            if type(fld).to_object != Field.to_object:
+                # Only overridden converters are called
+                ns["conv%d" % i] = fld.to_object
+                value, use_row = "conv%d(r, %s)" % (i, value), True
+            args.append("%r: %s" % (fld.name, value))
+        src  = "def _factory(cur, row):\n"
+        if use_row: src += "    r = Row(cur, row)\n"
+        src += "    return cls(**{%s})\n" % ", ".join(args)
+        exec(src, ns)
+        return ns["_factory"]
+
 #        cur = conn.cursor()
 #        rows = conn.get_table_info(table_name)
 #        if not len(rows): raise cls.TableDoesNotExist()
@@ -455,7 +607,8 @@ class Field(property):
         self.null, self.default, self.unique = null, default, unique
         self.is_primary_key = primary_key
         self.extra_sql = extra_sql
-        _pre_field_order.append(self)
+        self._creation_order = next(_field_counter)
+        self._qualified = (None, None, None)   # (table name, field name, qualified name)
 
     def cast(self, value): return value
     def set(self, obj, value): return value
@@ -468,11 +621,18 @@ class Field(property):
             raise ValidationError("Field '%s' does not accept None value." % self.name)
         return True
 
-    def __get__(self, owner_obj, cls): return owner_obj._data.get(self.name, None)
+    def __get__(self, owner_obj, cls): return owner_obj._data.get(self.name)
     def __set__(self, owner_obj, value):
         self.validate(self, value)
         owner_obj._data[self.name] = self.cast(value)
 
+    def qualified_name(self, tblname):
+        """Returns the column name qualified with *tblname* (ex. '"member"."name"')."""
+        cached = self._qualified
+        if cached[0] != tblname or cached[1] != self.name:
+            cached = self._qualified = (tblname, self.name, '"' + tblname + '"."' + self.name + '"')
+        return cached[2]
+
     def field_clause(self):
         if self.type == Field.SQL_TYPE:
             warnings.warn("'%s'.type is '%s'." % (self.__class__.__name__, Field.SQL_TYPE))
@@ -493,35 +653,62 @@ class Field(property):
 class AtCreate(Field): pass
 class AtSave(Field): pass
 
+# Parsers and formatters for date and time columns.
+# Values are stored as fixed width text, so they are matched with a precompiled pattern
+# instead of strptime()/strftime(). Anything else (fractional seconds etc.) falls back to strptime().
+_TIMESTAMP_RE = re.compile(r"([0-9]{4})-([0-9]{2})-([0-9]{2}) ([0-9]{2}):([0-9]{2}):([0-9]{2})\Z")
+_DATE_RE = re.compile(r"([0-9]{4})-([0-9]{2})-([0-9]{2})\Z")
+_TIME_RE = re.compile(r"([0-9]{2}):([0-9]{2}):([0-9]{2})\Z")
+
+def _parse_timestamp(s):
+    m = _TIMESTAMP_RE.match(s)
+    if m: return datetime(*[int(x) for x in m.groups()])
+    return datetime.strptime(s, "%Y-%m-%d %H:%M:%S.%f" if "." in s else "%Y-%m-%d %H:%M:%S")
+
+def _parse_date(s):
+    m = _DATE_RE.match(s)
+    if m: return date(*[int(x) for x in m.groups()])
+    return datetime.strptime(s, "%Y-%m-%d").date()
+
+def _parse_time(s):
+    m = _TIME_RE.match(s)
+    if m: return time(*[int(x) for x in m.groups()])
+    return datetime.strptime(s, "%H:%M:%S.%f" if "." in s else "%H:%M:%S").time()
+
+def _format_timestamp(v):
+    return "%04d-%02d-%02d %02d:%02d:%02d" % (v.year, v.month, v.day, v.hour, v.minute, v.second)
+def _format_date(v): return "%04d-%02d-%02d" % (v.year, v.month, v.day)
+def _format_time(v): return "%02d:%02d:%02d" % (v.hour, v.minute, v.second)
+
 class TimestampField(Field):
     TYPE_NAMES = (r"^TIMESTAMP$", r"^DATETIME$")
     SQL_TYPE = "TIMESTAMP"
     def to_database(self, obj, value):
         if value is None: return None
-        return value.strftime("%Y-%m-%d %H:%M:%S")
+        return _format_timestamp(value)
     def to_object(self, row, value):
-        if value is None: return None
-        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        if value is None or isinstance(value, datetime): return value
+        return _parse_timestamp(value)
 
 class DateField(Field):
     TYPE_NAMES = (r"^DATE$",)
     SQL_TYPE = "DATE"
     def to_database(self, obj, value):
         if value is None: return None
-        return value.strftime("%Y-%m-%d")
+        return _format_date(value)
     def to_object(self, row, value):
-        if value is None: return None
-        return datetime.strptime(value, "%Y-%m-%d").date()
+        if value is None or isinstance(value, date): return value
+        return _parse_date(value)
 
 class TimeField(Field):
     TYPE_NAMES = (r"^TIME$",)
     SQL_TYPE = "TIME"
     def to_database(self, obj, value):
         if value is None: return None
-        return value.strftime("%H:%M:%S")
+        return _format_time(value)
     def to_object(self, row, value):
-        if value is None: return None
-        return datetime.strptime(value, "%H:%M:%S").time()
+        if value is None or isinstance(value, time): return value
+        return _parse_time(value)
 
 class TimestampAtCreate(TimestampField, AtCreate):
     def __init__(self, **kw):
@@ -549,6 +736,7 @@ class FloatField(Field):
     TYPE_NAMES = ("REAL", "FLOA", "DOUB")
     SQL_TYPE = "FLOAT"
     VALUE_TYPE = "NUM"
+    VALUE_DESC = "a number"     # for error message
 
     def __init__(self, max=None, min=None, **kw):
         super(FloatField, self).__init__(**kw)
@@ -560,11 +748,15 @@ class FloatField(Field):
         return float(value)
 
     def validate(self, obj, value):
-        super(FloatField, self).validate(obj, value)
-        if value == None: return True
-        try: self.cast(value)
-        except (ValueError, TypeError):
-            raise ValidationError("Field '%s': Value must be a number, not '%s' [%s]." % (self.name, type(value).__name__, value))
+        # Checks of Field#validate() are inlined, and numbers are not casted for checking.
+        if value is None:
+            if not self.null: raise ValidationError("Field '%s' does not accept None value." % self.name)
+            return True
+        if not isinstance(value, (int, float)):
+            try: self.cast(value)
+            except (ValueError, TypeError):
+                fmt = "Field '%s': Value must be %s, not '%s' [%s]."
+                raise ValidationError(fmt % (self.name, self.VALUE_DESC, type(value).__name__, value))
         if self.max != None and value > self.max:
             raise ValidationError("Field '%s': Max value is exceeded. [%d]" % (self.name, value))
         if self.min != None and value < self.min:
@@ -574,6 +766,7 @@ class FloatField(Field):
 class IntegerField(FloatField):
     TYPE_NAMES = ("INT",)
     SQL_TYPE = "INTEGER"
+    VALUE_DESC = "an integer"
 
 #    def initialize_after_meta(self):
 #        if re.match(r"^INTEGER$", self.type, re.I) and self.is_primary_key: self.null = True
@@ -582,14 +775,6 @@ class IntegerField(FloatField):
         if value == None: return None
         return int(value)
 
-    def validate(self, obj, value):
-        super(IntegerField, self).validate(obj, value)
-        if value == None: return True
-        try: self.cast(value)
-        except (ValueError, TypeError):
-            raise ValidationError("Field '%s': Value must be an integer, not '%s' [%s]." % (type(value).__name__, value))
-        return True
-
 class SerialKeyField(IntegerField):
     def __init__(self, primary_key=True, null=True, **kw):
         super(SerialKeyField, self).__init__(primary_key=primary_key, null=null, **kw)
@@ -629,11 +814,12 @@ class MatchingField(CharField):
     def __init__(self, pattern, **kw):
         super(MatchingField, self).__init__(**kw)
         self.pattern = pattern
+        self._pattern_re = re.compile(pattern)
 
     def validate(self, obj, value):
         super(MatchingField, self).validate(obj, value)
         if value == None: return True
-        if not re.match(self.pattern, value):
+        if not self._pattern_re.match(value):
             raise ValidationError("Field '%s': Text does not match patern." % self.name)
         return True
 
@@ -649,19 +835,14 @@ class ManyToOne(Field):
         self.related_name = related_name    #: accessor name for one to many relation
         self.on_delete = on_delete
         self.on_update = on_update
-        _pre_field_order.append(self)
+        self._select_sql = None             # SELECT statement for the referenced object
 
-    def set_query(self, query_set, tblname, name):
-        h = {
-            "reftbl": self.ref._meta.table_name,
-            "refkey": self.ref_key,
-            "clstbl": tblname,
-            "clskey": self.fkey,
-            "fldname": "%s.%s" % (tblname, name)
-        }
-        tmpl = 'INNER JOIN "%(reftbl)s" AS "%(fldname)s" ON "%(clstbl)s"."%(clskey)s" = "%(fldname)s"."%(refkey)s"'
-        query_set.clauses["joins"].append(tmpl % h)
-        return self.ref, h["fldname"]
+    def sql_joins(self, tblname, name):
+        """Returns the referenced class, its alias and JOIN clauses"""
+        fldname = tblname + "." + name
+        join = 'INNER JOIN "%s" AS "%s" ON "%s"."%s" = "%s"."%s"' \
+            % (self.ref._meta.table_name, fldname, tblname, self.fkey, fldname, self.ref_key)
+        return self.ref, fldname, [join]
 
     def _get_ref_key(self):
         self._ref_key = self._ref_key or self.ref._meta.primary_key.name
@@ -671,25 +852,29 @@ class ManyToOne(Field):
 
     def __get__(self, owner, cls):
         if getattr(owner, self.fkey) is None: return None
-        reftbl = self.ref._meta.table_name
-        clstbl = cls._meta.table_name
 #        sql = 'SELECT "%s".* FROM "%s" LEFT JOIN "%s" ON "%s" = "%s"."%s" WHERE "%s"."%s" = ?' \
 #            % (reftbl, clstbl, reftbl, self.fkey, reftbl, self.ref_key, \
 #               clstbl, cls._meta.primary_key.name)
-        sql = 'SELECT * FROM "%s" WHERE "%s" = ?' % (reftbl, self.ref_key)
+        if self._select_sql is None:
+            # Two rows are enough to detect non-unique reference key
+            self._select_sql = 'SELECT * FROM "%s" WHERE "%s" = ? LIMIT 2' % (self.ref._meta.table_name, self.ref_key)
         cur = cls._meta._conn.cursor()
 #        cur = cur.execute(sql, [owner.pk])
-        cur = cur.execute(sql, [getattr(owner, self.fkey)])
-        row = cur.fetchone()
-        if cur.fetchone(): raise NotUniqueForeignKey("Reference key '%s.%s' is not unique." % (reftbl, self.ref_key))
-        return self.ref._factory(cur, row)
+        cur = cur.execute(self._select_sql, [getattr(owner, self.fkey)])
+        rows = cur.fetchall()
+        if len(rows) > 1:
+            raise NotUniqueForeignKey("Reference key '%s.%s' is not unique." % (self.ref._meta.table_name, self.ref_key))
+        if not rows: return None
+        return self.ref._factory(cur, rows[0])
+
+    def __set__(self, owner, value): setattr(owner, self.fkey, self.fkey_value(value))
 
-    def __set__(self, owner, value):
+    def fkey_value(self, value):
+        """Returns the foreign key value which refers the object *value*"""
         if value and not isinstance(value, self.ref):
             raise TypeError("This is related to '%s', not '%s'." % (self.ref.__name__, value.__class__.__name__))
-        if value is None: v = None
-        else: v = getattr(value, self.ref_key)
-        setattr(owner, self.fkey, v)
+        if value is None: return None
+        return getattr(value, self.ref_key)
 
     def _called_in_modelmeta_init(self, rev_cls, fld_name):
         """Sets up one-to-many definition method.
@@ -700,10 +885,11 @@ class ManyToOne(Field):
         # If self.ref is string and the class have not been initialized,
         # initializing the relationship is suspended.
         if isinstance(self.ref, str):
-            if not hasattr(sys.modules[rev_cls.__module__], self.ref):
+            ref_cls = getattr(sys.modules[rev_cls.__module__], self.ref, None)
+            if ref_cls is None:
                 type(rev_cls).suspended[self.ref] = (self, rev_cls, fld_name)
                 return
-            self.ref = getattr(sys.modules[rev_cls.__module__], self.ref)
+            self.ref = ref_cls
 
         self.name = fld_name    # set field name
         if not self.fkey: self.fkey = "%s_id" % self.name
@@ -720,20 +906,15 @@ class _ManyToOne_Rev(property):
         self._ref_key = ref_key     # Key column name of parent
         self.rev = rev              # Child table (many side)
         self.rev_fkey = rev_fkey    # Foreign key name of child
+        self._base_query = (None, None) # (TableMetaInfo, QuerySet without value) used in __get__
         assert self.rev_fkey, "Foreign key was not specified in ManyToOne#_called_in_modelmeta_init"
 
-    def set_query(self, query_set, tblname, name):
+    def sql_joins(self, tblname, name):
         # Generate INNER JOIN-ed clause
-        h = {
-            "revtbl": self.rev._meta.table_name,
-            "revkey": self.rev_fkey,
-            "reftbl": tblname,
-            "refkey": self.ref_key,
-            "fldname": "%s.%s" % (tblname, name),
-        }
-        tmpl = 'INNER JOIN "%(revtbl)s" AS "%(fldname)s" ON "%(reftbl)s"."%(refkey)s" = "%(fldname)s"."%(revkey)s"'
-        query_set.clauses["joins"].append(tmpl % h)
-        return self.rev, h["fldname"]
+        fldname = tblname + "." + name
+        join = 'INNER JOIN "%s" AS "%s" ON "%s"."%s" = "%s"."%s"' \
+            % (self.rev._meta.table_name, fldname, tblname, self.ref_key, fldname, self.rev_fkey)
+        return self.rev, fldname, [join]
 
     def _get_ref_key(self):
         self._ref_key = self._ref_key or self.ref._meta.primary_key.name
@@ -742,8 +923,14 @@ class _ManyToOne_Rev(property):
     ref_key = property(_get_ref_key)
 
     def __get__(self, owner, cls):
-        qs = self.rev.select("%s = ?" % self.rev_fkey, [getattr(owner, self.ref_key)])
-        return ManyToOneRevSet(qs, owner, self)
+        # The base QuerySet is never executed, it is only copied for each owner.
+        meta, base = self._base_query
+        if meta is not self.rev._meta:
+            meta, base = self.rev._meta, self.rev.select("%s = ?" % self.rev_fkey)
+            self._base_query = (meta, base)
+        qs = ManyToOneRevSet(base, owner, self)
+        qs.clauses["values"].append(getattr(owner, self.ref_key))
+        return qs
 
 # --- Many-to-many relationship
 class _ManyToManyBase(property):
@@ -752,6 +939,7 @@ class _ManyToManyBase(property):
         self.lnk = lnk
         self.cls = cls
         self.name = name
+        self._base_query = (None, None) # (TableMetaInfo, QuerySet without value) used in __get__
 
     def _get_link_class(self):
         if (PY3K and isinstance(self._lnk, (str, bytes))) or (not PY3K and isinstance(self._lnk, basestring)):
@@ -761,32 +949,31 @@ class _ManyToManyBase(property):
     lnk = property(_get_link_class, _set_link_class)
 
     def __get__(self, owner, cls):
-        qs = cls.select('"%s"."%s"=?' % (cls._meta.table_name, cls._meta.primary_key.name), [owner.pk])
-        return ManyToManySet(qs, owner, self.ref, self.lnk)
+        # The base QuerySet is never executed, it is only copied for each owner.
+        meta, base = self._base_query
+        if meta is not cls._meta:
+            meta = cls._meta
+            base = cls.select('"%s"."%s"=?' % (meta.table_name, meta.primary_key.name))
+            self._base_query = (meta, base)
+        qs = ManyToManySet(base, owner, self.ref, self.lnk)
+        qs.clauses["values"].append(owner.pk)
+        return qs
 
 class ManyToMany(_ManyToManyBase):
     def __init__(self, ref, related_name=None, lnk=None):
         super(ManyToMany, self).__init__(ref, lnk=lnk)
         self.related_name = related_name
 
-    def set_query(self, query_set, tblname, name):
-        h = {
-            "clstbl": tblname,
-            "clskey": self.cls._meta.primary_key.name,
-            "reftbl": self.ref._meta.table_name,
-            "refkey": self.ref._meta.primary_key.name,
-            "lnktbl": self.lnk._meta.table_name,
-            "fldname": "%s.%s" % (tblname, name),
-        }
-        h["lnkclskey"] = "%s_id" % self.cls._meta.table_name
-        h["lnkrefkey"] = "%s_id" % h["reftbl"]
-        query_set.clauses["joins"].append(
-            'INNER JOIN "%(lnktbl)s" AS "%(fldname)s.lnk" ON "%(clstbl)s"."%(clskey)s" = "%(fldname)s.lnk"."%(lnkclskey)s"' % h
-        )
-        query_set.clauses["joins"].append(
-            'INNER JOIN "%(reftbl)s" AS "%(fldname)s" ON "%(fldname)s.lnk"."%(lnkrefkey)s" = "%(fldname)s"."%(refkey)s"' % h
-        )
-        return self.ref, h["fldname"]
+    def sql_joins(self, tblname, name):
+        fldname = tblname + "." + name
+        reftbl = self.ref._meta.table_name
+        return self.ref, fldname, [
+            'INNER JOIN "%s" AS "%s.lnk" ON "%s"."%s" = "%s.lnk"."%s_id"'
+                % (self.lnk._meta.table_name, fldname, tblname, self.cls._meta.primary_key.name,
+                   fldname, self.cls._meta.table_name),
+            'INNER JOIN "%s" AS "%s" ON "%s.lnk"."%s_id" = "%s"."%s"'
+                % (reftbl, fldname, fldname, reftbl, fldname, self.ref._meta.primary_key.name),
+        ]
 
     def _called_in_modelmeta_init(self, cls, fld_name):
         # This method will be called in ModelMeta#__init__().
@@ -804,16 +991,28 @@ class ManyToMany(_ManyToManyBase):
             self.cls.__name__.lower(): ManyToOne(self.cls, on_delete="CASCADE", on_update="CASCADE"),
             self.ref.__name__.lower(): ManyToOne(self.ref, on_delete="CASCADE", on_update="CASCADE"),
         }
-        cls = type(name, (Model,), h)
         return type(name, (Model,), h)
 
 # --- QuerySet
 class QuerySet(object):
     """This class generates SQL which like QuerySet in Django"""
+    _field_name_cache = {}  # (Model class, field name) -> result of _resolve_field_name()
+    _filter_cache = {}      # (Model class, field name) -> function made by OpConverter#compile_filter()
+    _sql_templates = {}     # Clauses -> generated SQL (shared by QuerySets of the same shape)
+    sql_cache_size = 1024   # The SQL cache is cleared when it reaches this number of entries
+    fetch_size = 128        # Number of rows fetched from the cursor at once
+    _order_field_re = re.compile(r"(\w+)\.(\w+)")  # 'relation.field' in order_by()
+
     def __init__(self, parent):
         if isinstance(parent, QuerySet):
             self.cls = parent.cls
-            self.clauses = copy.deepcopy(parent.clauses)
+            # Lists of clauses are copied, the others are immutable.
+            c = parent.clauses
+            self.clauses = {
+                "type": c["type"], "joins": c["joins"][:], "where": c["where"][:],
+                "order_by": c["order_by"][:], "values": c["values"][:], "distinct": c["distinct"],
+                "offset": c["offset"], "limit": c["limit"], "select_fields": c["select_fields"],
+            }
             self.factory = parent.factory   # Factory method converting record to object
             self.wrapper_clause = parent.wrapper_clause
         else:
@@ -826,6 +1025,7 @@ class QuerySet(object):
             self.clauses["select_fields"] = '"%s".*' % self.cls.__dict__["_meta"].table_name
             self.wrapper_clause = None
         self.parent = parent
+        self._sql_cache = None  # Generated SQL (clauses are not changed after the QuerySet is used)
         self._initialize_cursor()
 
     def _initialize_cursor(self):
@@ -833,6 +1033,7 @@ class QuerySet(object):
         self.cur = None     # cursor
         self._index = -1    # pointer
         self._cache = []    # cache list
+        self._pending = collections.deque()  # rows fetched but not converted yet
 
     def _generate_sql(self):
         # To delete: wrapper_clause is set to DELETE...
@@ -844,30 +1045,48 @@ class QuerySet(object):
         if len(self.clauses["joins"]): sqls += self.clauses["joins"]
 
         if len(self.clauses["where"]):
-            sqls.append("WHERE %s" % " AND ".join(["(%s)" % c for c in self.clauses["where"]]))
+            sqls.append("WHERE (" + ") AND (".join(self.clauses["where"]) + ")")
 
         if len(self.clauses["order_by"]):
             sqls.append('ORDER BY %s' % ', '.join(self.clauses["order_by"]))
-        if self.clauses["limit"] is not None: sqls.append("LIMIT %d" % self.clauses["limit"])
-        if self.clauses["offset"] is not None: sqls.append("OFFSET %d" % self.clauses["offset"])
+        if self.clauses["limit"] is not None: sqls.append("LIMIT " + str(int(self.clauses["limit"])))
+        if self.clauses["offset"] is not None: sqls.append("OFFSET " + str(int(self.clauses["offset"])))
 
         if self.wrapper_clause:
             return self.wrapper_clause % "\n".join(sqls)
 
         return "\n".join(sqls)
 
-    sql = property(_generate_sql)   #: Generating SQL
+    def _get_sql(self):
+        if self._sql_cache is None:
+            c = self.clauses
+            key = (self.cls, c["select_fields"], c["distinct"], tuple(c["joins"]), tuple(c["where"]),
+                   tuple(c["order_by"]), c["limit"], c["offset"], self.wrapper_clause)
+            sql = QuerySet._sql_templates.get(key)
+            if sql is None:
+                if len(QuerySet._sql_templates) >= QuerySet.sql_cache_size: QuerySet._sql_templates.clear()
+                sql = QuerySet._sql_templates[key] = self._generate_sql()
+            self._sql_cache = sql
+        return self._sql_cache
+    sql = property(_get_sql)    #: Generating SQL
 
     def _execute(self):
         """Getting and setting a new cursor"""
         self._initialize_cursor()
         self.cur = self.cls._meta._conn.cursor().execute(self.sql, self.clauses["values"])
+        self._row_factory = self.factory
+        if self.cur.description and getattr(self.factory, "__func__", None) is Model._factory.__func__:
+            # Model._factory: the generated function for the columns is used directly
+            self._row_factory = self.factory.__self__._meta.get_factory(self.cur.description)
 
     def _convert_order_fields(self, fields):
         """Convert order ['-id', 'name'] to ['"id" DESC', '"name"']"""
+        resolved = set()    # Relation names whose joins are resolved in this call
         def conv(m):
             fldname = m.group(1)
             res = '"%s"."%s"' % (m.group(1), m.group(2))
+            if fldname in resolved: return res
+            resolved.add(fldname)
             fld = self.cls.__dict__.get(fldname, "None")
             if not fld: return res
 #            h = {"as":fldname, "me":self.cls._meta.table_name, "me_key":self.cls._meta.primary_key.name}
@@ -881,14 +1100,15 @@ class QuerySet(object):
                 h["refkey"] = fld.rev_fkey
             else: return res
             fmt = 'INNER JOIN "%(ref)s" AS "%(as)s" ON "%(me)s"."%(me_key)s" = "%(as)s"."%(refkey)s"'
-            self.clauses["joins"].append(fmt % h)
+            join = fmt % h
+            if join not in self.clauses["joins"]: self.clauses["joins"].append(join)
             return res
 
         res = []
         for n in fields:
             desc = ""
             if n.startswith("-"): n, desc = n[1:], " DESC"
-            if re.match(r"(\w+)\.(\w+)", n): n = re.sub(r"(\w+)\.(\w+)", conv, n)
+            if QuerySet._order_field_re.match(n): n = QuerySet._order_field_re.sub(conv, n)
             else: n = '"%s"' % n
             res.append('%s%s' % (n, desc))
         return res
@@ -899,11 +1119,13 @@ class QuerySet(object):
 
     def next(self):
         if not self.cur: self._execute()
-        row = self.cur.fetchone()
+        pending = self._pending
+        if not pending: pending.extend(self.cur.fetchmany(self.fetch_size))
         self._index += 1
-        if not row: raise StopIteration()
-        self._cache.append(self.factory(self.cur, row))
-        return self._cache[-1]
+        if not pending: raise StopIteration()
+        obj = self._row_factory(self.cur, pending.popleft())
+        self._cache.append(obj)
+        return obj
     __next__ = next
 
     def get(self, *args, **kw):
@@ -918,58 +1140,94 @@ class QuerySet(object):
 
     def select(self, *args, **kw):
         newset = self.__class__(self)
+        if not args and not kw: return newset   # e.g. all()
+        where, values = newset.clauses["where"], newset.clauses["values"]
         if len(args) == 1:
-            newset.clauses["where"].append(args[0])
+            where.append(args[0])
         elif len(args) == 2:
-            newset.clauses["where"].append(args[0])
-            if isinstance(args[1], (list, tuple)): newset.clauses["values"] += list(args[1])
-            else: newset.clauses["values"].append(args[1])
+            where.append(args[0])
+            if isinstance(args[1], (list, tuple)): values.extend(args[1])
+            else: values.append(args[1])
         elif len(args) > 2:
             raise RuntimeError("arg1 must be primary key value or arg1, arg2 must be where and values.")
 
         # Parse keywords
         for k, v in kw.items():
-            curmdl = self.cls
-            curname = self.cls._meta.table_name
-
             if isinstance(v, Model):
                 # Specified with Model object
                 k += "__%s" % v._meta.primary_key.name
                 v = v.pk
 
-            items = k.split("__")
-            while items:
-                item = items.pop(0)
-                fld = curmdl.__dict__[item]
-                if callable(getattr(fld, "set_query", None)):
-                    # Fields of ManyToOne, _ManyToOne_Rev, ManyToMany
-                    curmdl, curname = fld.set_query(newset, curname, item)
-                elif isinstance(fld, Field):
-                    break
-                else:
-                    raise RuntimeError("Invalid column name. '%s(%s)'" % (item, fld.__class__.__name__))
-
-            # Convert field name and value
-            if len(items) >= 2:
-                raise RuntimeError("Invalid operand name. '%s'" % "__".join(items))
-
             # Parsing inline operator
-            opc = OpConverter(curname)
-            whr, prm = opc.get_clause(items[0] if items else None, fld, v)
-            newset.clauses["where"].append(whr)
+            whr, prm = newset._filter_clause(k)(v)
+            where.append(whr)
             if prm is not None:
-                if isinstance(prm, (list, tuple)): newset.clauses["values"] += list(prm)
-                else: newset.clauses["values"].append(prm)
+                if isinstance(prm, (list, tuple)): values.extend(prm)
+                else: values.append(prm)
 
         return newset
 
+    def _filter_clause(self, name):
+        """Returns the function converting a value to WHERE clause and parameter
+        for the field name such as 'band__name__like', and adds required joins.
+        """
+        curname, fld, op = self._parse_field_name(name)
+        key = (self.cls, name)
+        func = QuerySet._filter_cache.get(key)
+        if func is None:
+            func = QuerySet._filter_cache[key] = OpConverter(curname).compile_filter(op, fld)
+        return func
+
+    def _parse_field_name(self, name):
+        """Parses field name such as 'band__name__like' and adds required joins.
+        Returns table name (or alias), :class:`Field` object and operator.
+        """
+        key = (self.cls, name)
+        parsed = QuerySet._field_name_cache.get(key)
+        if parsed is None:
+            parsed = QuerySet._field_name_cache[key] = self._resolve_field_name(name)
+        curname, fld, op, joins = parsed
+        for join in joins:
+            if join not in self.clauses["joins"]: self.clauses["joins"].append(join)
+        return curname, fld, op
+
+    def _resolve_field_name(self, name):
+        curmdl = self.cls
+        curname = self.cls._meta.table_name
+        joins = []
+        items = name.split("__")
+        i, n = 0, len(items)
+        while i < n:
+            item = items[i]
+            i += 1
+            # Class __dict__ is used because descriptors must not be invoked
+            fld = curmdl.__dict__.get(item)
+            if fld is None:
+                raise RuntimeError("Invalid column name. '%s'" % item)
+            if callable(getattr(fld, "sql_joins", None)):
+                # Fields of ManyToOne, _ManyToOne_Rev, ManyToMany
+                curmdl, curname, fld_joins = fld.sql_joins(curname, item)
+                joins += fld_joins
+            elif isinstance(fld, Field):
+                break
+            else:
+                raise RuntimeError("Invalid column name. '%s(%s)'" % (item, fld.__class__.__name__))
+
+        # Convert field name and value
+        remaining = n - i
+        if remaining >= 2:
+            raise RuntimeError("Invalid operand name. '%s'" % "__".join(items[i:]))
+        return curname, fld, (items[i] if remaining else None), tuple(joins)
+
     def all(self):
         return self.select()
 
     def delete(self):
         self.clauses["type"] = "DELETE"
-        h = {"tbl": self.cls._meta.table_name, "pk": self.cls._meta.primary_key.name}
-        self.wrapper_clause = 'DELETE FROM "%(tbl)s" WHERE "%(pk)s" IN (SELECT "%(pk)s" FROM (\n%%s\n))' % h
+        meta = self.cls._meta
+        self.wrapper_clause = 'DELETE FROM %s WHERE %s IN (SELECT %s FROM (\n%%s\n))' \
+            % (meta._table_quoted, meta._pk_quoted, meta._pk_quoted)
+        self._sql_cache = None
         self._execute()
 
     def distinct(self):
@@ -1050,6 +1308,8 @@ class ManyToOneRevSet(QuerySet):
         return self.cls.create(*args, **kw)
 
 class ManyToManySet(QuerySet):
+    _link_cache = {}    # (cls, ref, lnk) -> (TableMetaInfo objects, select_fields, joins)
+
     def __init__(self, parent_query, parent_object=None, ref=None, lnk=None):
         super(ManyToManySet, self).__init__(parent_query)
         # When call on slice procedure of QuerySet, return
@@ -1058,24 +1318,35 @@ class ManyToManySet(QuerySet):
         self.parent = parent_object
         self.ref = ref
         self.lnk = lnk
-        clstbl, cls_id = self.cls._meta.table_name, self.cls._meta.primary_key.name
-        reftbl, ref_id = ref._meta.table_name, ref._meta.primary_key.name
-        lnktbl, lnkcls_id, lnkref_id = lnk._meta.table_name, "%s_id" % clstbl, "%s_id" % reftbl
-        self.clauses["select_fields"] = '"%s".*' % reftbl
-        self.clauses["joins"] = [
-            'INNER JOIN "%s" ON "%s"."%s" = "%s"' % (lnktbl, clstbl, cls_id, lnkcls_id),
-            'INNER JOIN "%s" ON "%s" = "%s"."%s"' % (reftbl, lnkref_id, reftbl, ref_id),
-        ]
+        select_fields, joins = self._link_clauses(self.cls, ref, lnk)
+        self.clauses["select_fields"] = select_fields
+        self.clauses["joins"] = list(joins)
         self.factory = ref._factory
+        # Foreign key names of the link class (see ManyToMany#generate_link_class)
+        self._lnkcls_key = "%s_id" % self.cls.__name__.lower()
+        self._lnkref_key = "%s_id" % ref.__name__.lower()
+
+    @staticmethod
+    def _link_clauses(cls, ref, lnk):
+        """Returns select fields and joins, cached while table meta is not changed"""
+        key, metas = (cls, ref, lnk), (cls._meta, ref._meta, lnk._meta)
+        cached = ManyToManySet._link_cache.get(key)
+        if cached is None or any(a is not b for a, b in zip(cached[0], metas)):
+            clstbl, cls_id = cls._meta.table_name, cls._meta.primary_key.name
+            reftbl, ref_id = ref._meta.table_name, ref._meta.primary_key.name
+            lnktbl, lnkcls_id, lnkref_id = lnk._meta.table_name, "%s_id" % clstbl, "%s_id" % reftbl
+            joins = (
+                'INNER JOIN "%s" ON "%s"."%s" = "%s"' % (lnktbl, clstbl, cls_id, lnkcls_id),
+                'INNER JOIN "%s" ON "%s" = "%s"."%s"' % (reftbl, lnkref_id, reftbl, ref_id),
+            )
+            cached = ManyToManySet._link_cache[key] = (metas, '"%s".*' % reftbl, joins)
+        return cached[1], cached[2]
 
     def append(self, *args, **kw):
         if len(args):
             if not isinstance(args[0], self.ref):
                 raise TypeError("Object must be '%s', not '%s'." % (self.ref.__name__, type(args[0]).__name__))
-            h = {
-                "%s_id" % self.cls.__name__.lower(): self.parent.pk,
-                "%s_id" % self.ref.__name__.lower(): args[0].pk,
-            }
+            h = {self._lnkcls_key: self.parent.pk, self._lnkref_key: args[0].pk}
             self.lnk.create(**h)
             return args[0]
         obj = self.ref.create(**kw)
@@ -1083,15 +1354,12 @@ class ManyToManySet(QuerySet):
 
     def pop(self, refobj):
         """Pop many-to-many link object"""
-        h = {
-            "%s_id" % self.cls.__name__.lower(): self.parent.pk,
-            "%s_id" % self.ref.__name__.lower(): refobj.pk,
-        }
+        h = {self._lnkcls_key: self.parent.pk, self._lnkref_key: refobj.pk}
         self.lnk.select(**h).delete()
         return refobj
 
     def clear(self):
-        self.lnk.select(**{"%s_id" % self.cls.__name__.lower(): self.parent.pk}).delete()
+        self.lnk.select(**{self._lnkcls_key: self.parent.pk}).delete()
 
 # --- BaseModel and Model class
 class ModelMeta(type):
@@ -1127,8 +1395,7 @@ class ModelMeta(type):
         if not has_primary_key:
             fld = SerialKeyField() # for Serial key
             cls.id = fld
-            _pre_field_order.pop(_pre_field_order.index(fld))
-            _pre_field_order.insert(0, fld)
+            fld._creation_order = -1    # Serial key is always the first column
             dict["_meta"].initial_field["id"] = fld
 
         # TEMPORARY BUG FIX:
@@ -1152,12 +1419,11 @@ class Model(HasModelMeta):
     _meta = None        #: accessor for TableMetaInfo (set in ModelMeta)
                         #  Accessing to _meta triggers initializing TableMetaInfo and Class attributes.
     def __init__(self, **kw):
-        self._data = {}
-        for fld in self.__class__._meta.fields: self._data[fld.name] = fld.default
+        meta = self.__class__._meta
+        self._data = meta._default_data.copy()
+        valid_kwargs = meta._valid_kwargs
         for k in kw.keys():
-            if (k not in self.__class__._meta.fields.keys()) \
-                    and not isinstance(self.__class__.__dict__[k], Field):
-                raise ValueError("Invalid column name '%s'." % k)
+            if k not in valid_kwargs: raise ValueError("Invalid column name '%s'." % k)
             setattr(self, k, kw[k])
         self._orig_pk = self.pk # Preserve original primary key value for modifing key value
 
@@ -1171,18 +1437,13 @@ class Model(HasModelMeta):
     @classmethod
     def _factory(cls, cur, row):
         """Convert raw values to object"""
-        h1 = dict([[d[0], row[i]] for i, d in enumerate(cur.description)])
-        h2 = {} # for create a new model object
-        for fld in cls._meta.fields:
-            h2[fld.name] = fld.to_object(sqlite3.Row(cur, row), h1[fld.name])
-        return cls(**h2)
+        return cls._meta.get_factory(cur.description)(cur, row)
 
     @classmethod
     def select_from(cls, sql, params=()):
-        objs = []
         cur = execute(sql, params)
-        for row in cur.fetchall(): objs.append(cls._factory(cur, row))
-        return objs
+        factory = cls._meta.get_factory(cur.description)
+        return [factory(cur, row) for row in cur.fetchall()]
 
     @classmethod
     def get(cls, *args, **kw): return QuerySet(cls).get(*args, **kw)
@@ -1196,37 +1457,88 @@ class Model(HasModelMeta):
     @classmethod
     def create(cls, **kw):
         """Creating new record"""
-        names = []
+        meta = cls._meta
         obj = cls(**kw)
-        for fld in cls._meta.fields:
-            if fld.is_primary_key and not getattr(obj, fld.name): continue
-            names.append(fld.name)
+        if getattr(obj, meta.primary_key.name): names, sql = meta._field_names, meta._insert_sql
+        else: names, sql = meta._insert_names, meta._insert_sql_no_pk
         Model._before_before_store(obj, "set", AtCreate)            # set value
         obj.before_create()
         obj.validate()
         Model._before_before_store(obj, "to_database", Field)   # convert object to database
         values = [getattr(obj, n) for n in names]
-        holder = ", ".join(["?"] * len(names))
-        sql = 'INSERT INTO "%s" ("%s") VALUES (%s)' % (cls._meta.table_name, '", "'.join(names), holder)
         cls._save_and_update_object(obj, sql, values)
         obj.after_create()
         return obj
 
+    @classmethod
+    def bulk_create(cls, rows):
+        """Creating new records at once with ``executemany()``.
+        The *rows* is a list of dicts which have field names (or ManyToOne names) and values.
+        The primary key is assigned by the database for rows which don't have it.
+        AtCreate values are set and values are converted with ``to_database``
+        (both get an object of the row like ``create()``),
+        but validation and ``before_create``/``after_create`` hooks are skipped.
+        Returns the number of inserted records.
+        """
+        rows = list(rows)
+        if not rows: return 0
+        meta = cls._meta
+        # Bound methods are looked up once, not for each row. All columns are inserted,
+        # so rows without the primary key pass NULL (the default of the key) for it.
+        setters = [(fld.name, fld.set) for fld in meta.fields_of(AtCreate)]
+        convs = [(fld.name, fld.to_database) for fld in meta.fields]
+        default_data = meta._default_data
+        names, valid_kwargs = frozenset(meta._field_names), meta._valid_kwargs
+        params = []
+        for h in rows:
+            rels = [k for k in h if k not in names]
+            if rels:
+                # ManyToOne values are converted to the foreign keys as Model.__init__() does
+                h = h.copy()
+                for k in rels:
+                    if k not in valid_kwargs: raise ValueError("Invalid column name '%s'." % k)
+                    rel = vars(cls)[k]
+                    h[rel.fkey] = rel.fkey_value(h.pop(k))
+            # The object is built without Model.__init__(), values are not validated
+            obj = cls.__new__(cls)
+            data = obj._data = default_data.copy()
+            data.update(h)
+            for name, set_value in setters: data[name] = set_value(obj, data[name])
+            params.append([to_database(obj, data[name]) for name, to_database in convs])
+        return meta._conn.cursor().executemany(meta._insert_sql, params).rowcount
+
+    @classmethod
+    def bulk_update(cls, objs):
+        """Updating the records of objects at once with ``executemany()``.
+        AtSave values are set to the objects, but validation and
+        ``before_save``/``after_save`` hooks are skipped.
+        Returns the number of updated records.
+        """
+        objs = list(objs)
+        if not objs: return 0
+        meta = cls._meta
+        convs = [(fld.name, fld.to_database) for fld in meta.fields]
+        params = []
+        for obj in objs:
+            for fld in meta.fields_of(AtSave): setattr(obj, fld.name, fld.set(obj, getattr(obj, fld.name)))
+            values = [to_database(obj, getattr(obj, name)) for name, to_database in convs]
+            values.append(obj._orig_pk)
+            params.append(values)
+        cur = meta._conn.cursor().executemany(meta._update_sql, params)
+        for obj in objs: obj._orig_pk = obj.pk
+        return cur.rowcount
+
     def save(self):
         """Updating the record"""
         cls = self.__class__
-        names = []
-        for fld in cls._meta.fields:
-#            if fld.is_primary_key: continue
-            names.append(fld.name)
-        holder = ", ".join(['"%s" = ?' % n for n in names])
+        meta = cls._meta
+        names = meta._field_names
         Model._before_before_store(self, "set", AtSave) # set value
         self.validate()
         self.before_save()
         Model._before_before_store(self, "to_database", Field)  # convert object to database
         values = [getattr(self, n) for n in names]
-        sql = 'UPDATE "%s" SET %s WHERE "%s" = ?' % (cls._meta.table_name, holder, cls._meta.primary_key.name)
-        cls._save_and_update_object(self, sql, values + [self._orig_pk]) # '_orig_pk' is preserved key value (see __init__)
+        cls._save_and_update_object(self, meta._update_sql, values + [self._orig_pk]) # '_orig_pk' is preserved key value (see __init__)
         self.after_save()
 
     @staticmethod
@@ -1235,24 +1547,26 @@ class Model(HasModelMeta):
         cur = cls._meta._conn.cursor().execute(sql, values)
         if obj.pk == None: current_id = cur.lastrowid
         else: current_id = obj.pk
-        newobj = cls.get(current_id)
-        for fld in cls._meta.fields: setattr(obj, fld.name, getattr(newobj, fld.name))
+        data = obj._data
+        if cls._meta._refetch_after_store or any(data[n] is not None and not isinstance(data[n], _TEXT_TYPES)
+                                                 for n in cls._meta._char_field_names):
+            newobj = cls.get(current_id)
+            for fld in cls._meta.fields: setattr(obj, fld.name, getattr(newobj, fld.name))
+        else:
+            setattr(obj, cls._meta.primary_key.name, current_id)
         obj._orig_pk = obj.pk
 
     def delete(self):
         """Deleting the record"""
-        cls = self.__class__
-        sql = 'DELETE FROM "%s" WHERE "%s" = ?' % (cls._meta.table_name, cls._meta.primary_key.name)
-        cls._meta._conn.cursor().execute(sql, [self.pk])
+        meta = self.__class__._meta
+        meta._conn.cursor().execute(meta._delete_sql, [self.pk])
 
     @staticmethod
     def _before_before_store(obj, meth_name, at_cls):
-        cls = obj.__class__
         # set value with at_cls object
-        for fld in cls._meta.fields:
-            if isinstance(fld, at_cls):
-                converter = getattr(fld, meth_name)
-                setattr(obj, fld.name, converter(obj, getattr(obj, fld.name)))
+        for fld in obj.__class__._meta.fields_of(at_cls):
+            converter = getattr(fld, meth_name)
+            setattr(obj, fld.name, converter(obj, getattr(obj, fld.name)))
 
     def validate(self):
         cls = self.__class__
@@ -1270,53 +1584,99 @@ class Model(HasModelMeta):
     def after_save(self): pass      # Called after UPDATE
 
     def __repr__(self):
-        return "<%s object %s>" % (self.__class__.__name__, self.pk)
-
-    def __unicode__(self): return u"<%s object %s>" % (self.__class__.__name__, self.pk)
-    def __str__(self): return unicode(self).encode("utf-8")
+        return "<%s object %s>" % (type(self).__name__, self.pk)
 
 # --- Aggregation functions
-class AggregateFunction(object):
-    def __init__(self, field_name): self.field_name = field_name
-class Avg(AggregateFunction):   name = "AVG"
-class Max(AggregateFunction):   name = "MAX"
-class Min(AggregateFunction):   name = "MIN"
-class Sum(AggregateFunction):   name = "SUM"
-class Total(AggregateFunction): name = "TOTAL"
-class Count(AggregateFunction): name = "COUNT"
+AggregateFunction = collections.namedtuple("AggregateFunction", ["name", "field_name"])
+def Avg(field_name):   return AggregateFunction("AVG", field_name)
+def Max(field_name):   return AggregateFunction("MAX", field_name)
+def Min(field_name):   return AggregateFunction("MIN", field_name)
+def Sum(field_name):   return AggregateFunction("SUM", field_name)
+def Total(field_name): return AggregateFunction("TOTAL", field_name)
+def Count(field_name): return AggregateFunction("COUNT", field_name)
 
 # --- Converter for operators
+# Templates of conditions have this placeholder for the column name (ex. "%s < ?").
+# It is substituted with str.replace() which does not parse the template as a format.
+_COLUMN = "%s"
+
 class OpConverter(object):
+    __slots__ = ("tblname",)
     CONV = {
         "lt": "<", "le": "<=", "ge": ">=", "gt": ">",
         "like": "LIKE", "glob": "GLOB", "regexp": "REGEXP",
     }
+    _OP_TEMPLATES = dict((op, "%%s %s ?" % sqlop) for op, sqlop in CONV.items())  # ex. "%s < ?"
     def __init__(self, tblname): self.tblname = tblname
 
     def get_clause(self, op, fld, value):
         if op:
-            if hasattr(self, "_OP_%s" % op): sqltmpl, value = getattr(self, "_OP_%s" % op)(value)
-            elif op in self.CONV: sqltmpl, value = "%%s %s ?" % self.CONV[op], value
-            else: raise ValueError("Operator '%s' is not supported." % op)
+            handler = self._HANDLERS.get(op)
+            if handler is not None: sqltmpl, value = handler(self, value)
+            else:
+                sqltmpl = self._OP_TEMPLATES.get(op)
+                if sqltmpl is None: raise ValueError("Operator '%s' is not supported." % op)
         else:
             sqltmpl, value = self._convert(fld, value)
-        return sqltmpl % '"%s"."%s"' % (self.tblname, fld.name), value
+        return sqltmpl.replace(_COLUMN, fld.qualified_name(self.tblname), 1), value
 
-    def _base_in(self, op, value): return "%%s %s (%s)" % (op, ",".join(["?"] * len(value))), value
+    def compile_filter(self, op, fld):
+        """Returns a function which converts a value to the clause and the value
+        like get_clause(). The operator and the column name are resolved here once.
+        """
+        qual = fld.qualified_name(self.tblname)
+        if not op:
+            convert = self._convert
+            def clause(value):
+                sqltmpl, value = convert(fld, value)
+                return sqltmpl.replace(_COLUMN, qual, 1), value
+        elif op in self._HANDLERS:
+            handler = self._HANDLERS[op]
+            def clause(value):
+                sqltmpl, value = handler(self, value)
+                return sqltmpl.replace(_COLUMN, qual, 1), value
+        elif op in self._OP_TEMPLATES:
+            sql = self._OP_TEMPLATES[op].replace(_COLUMN, qual, 1)
+            def clause(value): return sql, value
+        else: raise ValueError("Operator '%s' is not supported." % op)
+        return clause
+
+    _in_templates = {}  # (operator, number of values) -> SQL template
+
+    def _base_in(self, op, value):
+        key = (op, len(value))
+        sqltmpl = OpConverter._in_templates.get(key)
+        if sqltmpl is None:
+            sqltmpl = OpConverter._in_templates[key] = "%%s %s (%s)" % (op, ",".join("?" * key[1]))
+        return sqltmpl, value
     def _OP_in(self, value): return self._base_in("IN", value)
     def _OP_not_in(self, value): return self._base_in("NOT IN", value)
 
     def _base_between(self, op, value):
-        if not isinstance(value, collections.Iterable): raise TypeError("Between operator requires a list")
-        if len(value) != 2: raise ValueError("Between operator requires a list which consists of 2 values.")
-        return "%%s %s ? AND ?" % op, value
+        try: lower, upper = value
+        except TypeError: raise TypeError("Between operator requires a list")
+        except ValueError: raise ValueError("Between operator requires a list which consists of 2 values.")
+        return "%s " + op + " ? AND ?", (lower, upper)
     def _OP_between(self, value): return self._base_between("BETWEEN", value)
     def _OP_not_between(self, value): return self._base_between("NOT BETWEEN", value)
 
+    # Operator name -> method returning SQL template and value
+    _HANDLERS = {"in": _OP_in, "not_in": _OP_not_in, "between": _OP_between, "not_between": _OP_not_between}
+
+    # Type of value -> function returning SQL template and value
+    _CONVERTERS = {Like: lambda value: ("%s LIKE ?", value.likestr)}
+
+    _PRIMITIVE_TYPES = frozenset([int, float, str, bytes, bool] + ([] if PY3K else [long, unicode]))
+
     def _convert(self, fld, value):
+        # Plain values are the most common case, so they are checked first.
+        if type(value) in self._PRIMITIVE_TYPES: return "%s = ?", fld.to_database(None, value)
         if value is None:           return "%s IS NULL", None
         if value is NotNull:        return "%s IS NOT NULL", None
-        if isinstance(value, Like): return "%s LIKE ?", value.likestr
+        conv = self._CONVERTERS.get(type(value))
+        if conv is not None: return conv(value)
+        for cls, conv in self._CONVERTERS.items():     # subclasses (ex. of Like)
+            if isinstance(value, cls): return conv(value)
         return "%s = ?", fld.to_database(None, value)
 
 # --- Plugin for Bottle web framework
@@ -1324,6 +1684,7 @@ class MacaronPlugin(object):
     """Bottle plugin for Macaron"""
     name = "macaron"
     api = 2
+    __slots__ = ("dbfile", "commit_on_success")
 
     def __init__(self, dbfile=":memory:", commit_on_success=True):
         self.dbfile = dbfile
@@ -1337,28 +1698,50 @@ class MacaronPlugin(object):
         conf = ctx.config.get("macaron") or {}
 #       dbfile = conf.get("dbfile", self.dbfile)
 #       commit_on_success = conf.get("commit_on_success", self.commit_on_success)
-        import traceback as tb
-        import bottle
-        def wrapper(*args, **kwargs):
-#           macaronage(dbfile, lazy=True, autocommit=False, keep=True)
-            try:
-                ret_value = callback(*args, **kwargs)
-                if self.commit_on_success: bake()   # commit
-            except sqlite3.IntegrityError as e:
-                rollback()
-                traceback = None
-                if bottle.DEBUG:
-                    traceback = (history.lastsql, history.lastparams)
-                    sqllog = "[Macaron]LastSQL: %s\n[Macaron]Params : %s\n" % traceback
-                    bottle.request.environ["wsgi.errors"].write(sqllog)
-                raise bottle.HTTPError(500, "Database Error", e, tb.format_exc())
-            except bottle.HTTPResponse as e:
-                if self.commit_on_success: bake()   # commit on HTTP response (ex. redirect())
-                raise e
-            except:
-                rollback()
-                raise
-            return ret_value
+        if _bottle is None: raise ImportError("MacaronPlugin requires Bottle.")
+        HTTPResponse, IntegrityError = _bottle.HTTPResponse, sqlite3.IntegrityError
+        database_error, commit, abort = self._database_error, bake, rollback
+        if self.commit_on_success:
+            def wrapper(*args, **kwargs):
+#               macaronage(dbfile, lazy=True, autocommit=False, keep=True)
+                # The commit stays in the try clause to roll back when it fails.
+                try:
+                    ret_value = callback(*args, **kwargs)
+                    commit()
+                except IntegrityError as e:
+                    raise database_error(e)
+                except HTTPResponse:
+                    commit()    # commit on HTTP response (ex. redirect())
+                    raise
+                except:
+                    abort()
+                    raise
+                return ret_value
+        else:
+            def wrapper(*args, **kwargs):
+                try:
+                    return callback(*args, **kwargs)
+                except IntegrityError as e:
+                    raise database_error(e)
+                except HTTPResponse:
+                    raise
+                except:
+                    abort()
+                    raise
         return wrapper
 
+    @staticmethod
+    def _database_error(e):
+        """Rolls back and returns HTTPError for IntegrityError *e*.
+        This must be called in the except clause to get the traceback.
+        """
+        rollback()
+        if _bottle.DEBUG:
+            sqllog = "[Macaron]LastSQL: %s\n[Macaron]Params : %s\n" % (history.lastsql, history.lastparams)
+            _bottle.request.environ["wsgi.errors"].write(sqllog)
+        return _bottle.HTTPError(500, "Database Error", e, traceback.format_exc())
+
 TYPE_FIELDS = [IntegerField, FloatField, CharField]
+for _fldcls in TYPE_FIELDS:
+    _fldcls._TYPE_RES = tuple(re.compile(p, re.I) for p in _fldcls.TYPE_NAMES)
+del _fldcls
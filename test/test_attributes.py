@@ -169,6 +169,15 @@ class TestClassAttributes(unittest.TestCase):
 
         self.assertEqual(fld1.lnk, fld2.lnk)
 
+    def testFieldClassFromDeclaredType(self):
+        # Field class is detected from the declared type of column
+        self.assertEqual(macaron.FieldFactory.field_class("INTEGER"), macaron.IntegerField)
+        self.assertEqual(macaron.FieldFactory.field_class("bigint"), macaron.IntegerField)
+        self.assertEqual(macaron.FieldFactory.field_class("DOUBLE"), macaron.FloatField)
+        self.assertEqual(macaron.FieldFactory.field_class("VARCHAR(20)"), macaron.CharField)
+        self.assertEqual(macaron.FieldFactory.field_class("text"), macaron.CharField)
+        self.assertEqual(macaron.FieldFactory.field_class("BLOB"), macaron.Field)
+
 if __name__ == "__main__":
     import os
     if os.path.isfile(DB_FILE): os.unlink(DB_FILE)
@@ -11,6 +11,16 @@ from models import Team, Member, Song
 
 DB_FILE = ":memory:"
 
+class Item(macaron.Model):
+    name = macaron.CharField(null=True)
+
+class LowerAtCreate(macaron.CharField, macaron.AtCreate):
+    def set(self, obj, value): return obj.title.lower()
+
+class Book(macaron.Model):
+    title = macaron.CharField(max_length=20)
+    key   = LowerAtCreate(max_length=20)
+
 class TestBasicDefinitionAndOperation(unittest.TestCase):
     names = [
         ("Ritsu", "Tainaka", "Dr", "Ritsu Tainaka : Dr"),
@@ -108,6 +118,9 @@ class TestBasicDefinitionAndOperation(unittest.TestCase):
             self.assertEqual(str(member), "<Member '%s'>" % n[3])
             self.assertEqual(member.id, idx + 1)
 
+        # Unknown column name
+        self.assertRaises(ValueError, lambda: Member.create(band=team, nickname="Yui"))
+
         # Get member with primary key
         ritsu = Member.get(1)
         self.assertEqual(str(ritsu), "<Member 'Ritsu Tainaka : Dr'>")
@@ -216,6 +229,103 @@ class TestBasicDefinitionAndOperation(unittest.TestCase):
         sum_of_ages = team.members.all().aggregate(macaron.Sum("age"))
         self.assertEqual(sum_of_ages, 84)
 
+    def testDefaultRepresentation(self):
+        song = Song.create(name="Fuwa Fuwa Time")
+        self.assertEqual(repr(song), "<Song object 1>")
+        self.assertEqual(str(song), "<Song object 1>")
+
+    def testStoreWithoutRefetch(self):
+        # Song has no converted fields, so the stored object is not re-read
+        self.assertFalse(Song._meta._refetch_after_store)
+        song = Song.create(name="Fuwa Fuwa Time")
+        self.assertEqual((song.pk, song.name), (1, "Fuwa Fuwa Time"))
+        song = Song.create(id=10, name="Fudepen Ball-pen")
+        self.assertEqual((song.pk, song.name), (10, "Fudepen Ball-pen"))
+
+        song.name = "Fudepen ~Ball-pen~"
+        song.save()
+        self.assertEqual((song.pk, song.name), (10, "Fudepen ~Ball-pen~"))
+        self.assertEqual(Song.get(10).name, "Fudepen ~Ball-pen~")
+
+        # Changing the primary key
+        song.id = 11
+        song.save()
+        self.assertEqual(song.pk, 11)
+        song.name = "Fudepen"
+        song.save()
+        self.assertEqual(Song.get(11).name, "Fudepen")
+        self.assertRaises(Song.DoesNotExist, lambda: Song.get(10))
+        self.assertEqual(Song.all().count(), 2)
+
+        # Numbers are stored as text by the TEXT affinity, so the record is re-read
+        macaron.create_table(Item)
+        self.assertFalse(Item._meta._refetch_after_store)
+        item = Item.create(name=5)
+        self.assertEqual(item.name, "5")
+        self.assertEqual(Item.get(item.pk).name, "5")
+        item.name = 6
+        item.save()
+        self.assertEqual(item.name, "6")
+        self.assertEqual(Item.create(name="7").name, "7")
+
+    def testBulkCreateAndUpdate(self):
+        team = Team.create(name="Houkago Tea Time")
+        rows = [{"band_id": team.pk, "first_name": n[0], "last_name": n[1], "part": n[2]} for n in self.names]
+        self.assertEqual(Member.bulk_create(rows), 4)
+        self.assertEqual(team.members.count(), 4)
+        for idx, m in enumerate(team.members):
+            self.assertEqual(str(m), "<Member '%s'>" % self.names[idx][3])
+            self.assertEqual(m.age, 16)     # default value
+            self.assert_(m.created)         # set by AtCreate
+        self.assertRaises(ValueError, lambda: Member.bulk_create([{"nickname": "Yui"}]))
+
+        members = list(team.members)
+        for m in members: m.age = 17
+        self.assertEqual(Member.bulk_update(members), 4)
+        self.assertEqual(team.members.aggregate(macaron.Sum("age")), 68)
+        self.assert_(Member.get(1).modified)   # set by AtSave
+
+    def testBulkCreateWithPrimaryKey(self):
+        # Rows may or may not have the primary key
+        self.assertEqual(Song.bulk_create([{"name": "a"}, {"id": 50, "name": "b"}, {"name": "c"}]), 3)
+        self.assertEqual([(s.id, s.name) for s in Song.all().order_by("id")], [(1, "a"), (50, "b"), (51, "c")])
+
+    def testIterationOverFetchSize(self):
+        # Rows are fetched from the cursor in chunks of QuerySet.fetch_size
+        cnt = macaron.QuerySet.fetch_size * 2 + 44
+        Song.bulk_create([{"name": "Song %d" % i} for i in range(cnt)])
+        qs = Song.all().order_by("id")
+        names = [s.name for s in qs]
+        self.assertEqual(names, ["Song %d" % i for i in range(cnt)])
+        self.assertEqual(qs[200].name, "Song 200")
+        self.assertEqual(qs[cnt - 1].name, "Song %d" % (cnt - 1))
+
+        qs = Song.all().order_by("id")
+        for idx, s in enumerate(qs):
+            if idx == 150: break
+        self.assertEqual(s.name, "Song 150")
+        self.assertEqual(qs[130].name, "Song 130")   # cached
+        self.assertEqual(qs[250].name, "Song 250")   # fetched beyond the break
+        self.assertEqual(len(list(Song.all())), cnt)
+
+    def testBulkCreateWithAtCreateReadingObject(self):
+        # AtCreate#set() gets the object of the row like create()
+        macaron.create_table(Book)
+        self.assertEqual(Book.create(title="K-ON!").key, "k-on!")
+        self.assertEqual(Book.bulk_create([{"title": "Fuwa Fuwa"}, {"title": "Don't Say Lazy"}]), 2)
+        self.assertEqual([b.key for b in Book.all().order_by("id")], ["k-on!", "fuwa fuwa", "don't say lazy"])
+
+    def testBulkCreateWithRelation(self):
+        team = Team.create(name="Houkago Tea Time")
+        rows = [{"band": team, "first_name": n[0], "last_name": n[1], "part": n[2]} for n in self.names]
+        rows.append({"band": None, "first_name": "Sawako", "last_name": "Yamanaka"})
+        self.assertEqual(Member.bulk_create(rows), 5)
+        self.assertEqual(team.members.count(), 4)
+        self.assertEqual(Member.get(first_name="Yui").band, team)
+        self.assertEqual(Member.get(first_name="Sawako").band, None)
+        self.assertEqual(rows[0]["band"], team)     # rows are not modified
+        self.assertRaises(TypeError, lambda: Member.bulk_create([{"band": Song.create(name="x"), "first_name": "a", "last_name": "b"}]))
+
 if __name__ == "__main__":
     import os
     if os.path.isfile(DB_FILE): os.unlink(DB_FILE)
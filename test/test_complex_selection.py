@@ -21,6 +21,14 @@ class SubTitle(macaron.Model):
     title = macaron.CharField(max_length=30)
     movie = macaron.ManyToOne(Movie, related_name="subtitles", on_delete="CASCADE")
 
+class Season(macaron.Model):
+    name = macaron.CharField(max_length=30)
+    year = macaron.IntegerField()
+
+class Fan(macaron.Model):
+    name   = macaron.CharField(max_length=30)
+    season = macaron.ManyToOne(Season, ref_key="year", fkey="season_year", related_name="fans")
+
 class ComplexSelectionTestCase(unittest.TestCase):
     def setUp(self):
         macaron.macaronage(":memory:")
@@ -73,6 +81,25 @@ class ComplexSelectionTestCase(unittest.TestCase):
         self.assertEqual(qs.count(), 1)
         for rec in qs: self.assertEqual(rec.curename, "Happy")
 
+    def test_value_conversion(self):
+        sql = 'SELECT "member".* FROM "member"\nWHERE ("member"."curename" LIKE ?)'
+        qs = Member.select(curename=macaron.Like("Ha%"))
+        self.assertEqual(qs.sql, sql)
+        self.assertEqual(qs.clauses["values"], ["Ha%"])
+        self.assertEqual(qs.count(), 1)
+
+        class Prefix(macaron.Like):
+            def __init__(self, s): super(Prefix, self).__init__(s + "%")
+        qs = Member.select(curename=Prefix("Ha"))
+        self.assertEqual(qs.sql, sql)
+        self.assertEqual(qs.clauses["values"], ["Ha%"])
+        self.assertEqual(qs.count(), 1)
+
+        sql = 'SELECT "member".* FROM "member"\nWHERE ("member"."curename" IS NOT NULL)'
+        qs = Member.select(curename=macaron.NotNull)
+        self.assertEqual(qs.sql, sql)
+        self.assertEqual(qs.count(), 2)
+
     def test_regexp(self):
         sql  = 'SELECT "member".* FROM "member"\n'
         sql += 'INNER JOIN "membermovielink" AS "member.movies.lnk" ON "member"."id" = "member.movies.lnk"."member_id"\n'
@@ -159,6 +186,26 @@ class ComplexSelectionTestCase(unittest.TestCase):
         self.assertEqual(qs.count(), 1)
         for rec in qs: self.assertEqual(rec.curename, "Happy")
 
+    def test_selection_with_shared_join(self):
+        # The join for the same relation is added only once
+        sql  = 'SELECT "member".* FROM "member"\n'
+        sql += 'INNER JOIN "group" AS "member.mygroup" ON "member"."mygroup_id" = "member.mygroup"."id"\n'
+        sql += 'INNER JOIN "series" AS "member.mygroup.series" ON "member.mygroup"."series_id" = "member.mygroup.series"."id"\n'
+        sql += 'WHERE ("member.mygroup"."name" = ?) AND ("member.mygroup.series"."name" = ?)'
+        qs = Member.select(mygroup__name="Smile").select(mygroup__series__name="Smile Precure")
+        self.assertEqual(qs.sql, sql)
+        self.assertEqual(qs.count(), 1)
+        for rec in qs: self.assertEqual(rec.curename, "Happy")
+
+    def test_order_by_with_shared_join(self):
+        # The join for ordering fields of the same relation is added only once
+        sql  = 'SELECT "member".* FROM "member"\n'
+        sql += 'INNER JOIN "group" AS "mygroup" ON "member"."mygroup_id" = "mygroup"."id"\n'
+        sql += 'ORDER BY "mygroup"."name", "mygroup"."id" DESC'
+        qs = Member.all().order_by("mygroup.name", "-mygroup.id")
+        self.assertEqual(qs.sql, sql)
+        self.assertEqual([rec.curename for rec in qs], ["Fortune", "Happy"])
+
     def test_selection_with_m2m(self):
         sql  = 'SELECT "member".* FROM "member"\n'
         sql += 'INNER JOIN "membermovielink" AS "member.movies.lnk" ON "member"."id" = "member.movies.lnk"."member_id"\n'
@@ -220,6 +267,28 @@ class ComplexSelectionTestCase(unittest.TestCase):
         self.assertEqual(len(members), 1)
         self.assertEqual(members[0].curename, "Fortune")
 
+class ManyToOneReferenceTestCase(unittest.TestCase):
+    def setUp(self):
+        macaron.macaronage(":memory:")
+        macaron.create_table(Season)
+        macaron.create_table(Fan)
+        # Broken references can't be stored with foreign key constraints
+        macaron.execute("PRAGMA foreign_keys = OFF")
+
+    def tearDown(self):
+        macaron.bake()
+        macaron.cleanup()
+
+    def test_dangling_reference(self):
+        fan = Fan.create(name="Miyuki", season_year=1999)
+        self.assertEqual(Fan.get(fan.pk).season, None)
+
+    def test_not_unique_reference(self):
+        season = Season.create(name="Smile Precure", year=2012)
+        Season.create(name="Smile Precure 2", year=2012)
+        fan = Fan.create(name="Miyuki", season=season)
+        self.assertRaises(macaron.NotUniqueForeignKey, lambda: Fan.get(fan.pk).season)
+
 if __name__ == "__main__":
     unittest.main()
 
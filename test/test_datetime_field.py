@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Test for date and time fields.
+"""
+import unittest
+from datetime import datetime, date, time
+import macaron
+
+class TestDateTimeField(unittest.TestCase):
+    def setUp(self):
+        self.ts = macaron.TimestampField()
+        self.dt = macaron.DateField()
+        self.tm = macaron.TimeField()
+
+    def testText(self):
+        self.assertEqual(self.ts.to_object(None, "2024-05-01 10:20:30"), datetime(2024, 5, 1, 10, 20, 30))
+        self.assertEqual(self.dt.to_object(None, "2024-05-01"), date(2024, 5, 1))
+        self.assertEqual(self.tm.to_object(None, "10:20:30"), time(10, 20, 30))
+
+    def testFractionalSeconds(self):
+        self.assertEqual(self.ts.to_object(None, "2024-05-01 10:20:30.123456"), datetime(2024, 5, 1, 10, 20, 30, 123456))
+        self.assertEqual(self.tm.to_object(None, "10:20:30.5"), time(10, 20, 30, 500000))
+
+    def testMalformed(self):
+        for value in ("2024/05/01 10:20:30", "2024-05-01T10:20:30", "2024-05-01 10-20-30", "2024-+5-01 10:20:30",
+                      "2024-05-01 10:20:30\n"):
+            self.assertRaises(ValueError, self.ts.to_object, None, value)
+        for value in ("2024/05/01", "2024-05-1x", "20240501", "2024-05-01\n"):
+            self.assertRaises(ValueError, self.dt.to_object, None, value)
+        for value in ("10-20-30", "10:20", "1:2:3x", "10:20:30\n"):
+            self.assertRaises(ValueError, self.tm.to_object, None, value)
+
+    def testNone(self):
+        self.assertEqual(self.ts.to_object(None, None), None)
+        self.assertEqual(self.dt.to_object(None, None), None)
+        self.assertEqual(self.tm.to_object(None, None), None)
+        self.assertEqual(self.ts.to_database(None, None), None)
+
+    def testRoundTrip(self):
+        value = datetime(2024, 5, 1, 10, 20, 30)
+        self.assertEqual(self.ts.to_object(None, self.ts.to_database(None, value)), value)
+        self.assertEqual(self.dt.to_object(None, self.dt.to_database(None, value.date())), value.date())
+        self.assertEqual(self.tm.to_object(None, self.tm.to_database(None, value.time())), value.time())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -47,5 +47,15 @@ class TestHistoryLogger(unittest.TestCase):
         self.assertRaises(IndexError, _index_error)
         macaron.cleanup()
 
+    def testMacaronOption_HistoryMaxCount(self):
+        macaron.macaronage(DB_FILE, history=2)
+        macaron.execute(SQL_TEST)
+        macaron.execute("SELECT * FROM t_test WHERE id = ?", [1])
+        macaron.execute("SELECT * FROM t_test WHERE id = ?", [2])
+        self.assertEqual(macaron.history.count(), 2)
+        self.assertEqual(str(macaron.history[0]), "SELECT * FROM t_test WHERE id = ?\nparams: [2]")
+        self.assertEqual(str(macaron.history[1]), "SELECT * FROM t_test WHERE id = ?\nparams: [1]")
+        macaron.cleanup()
+
 if __name__ == "__main__":
     unittest.main()